@@ -11,45 +11,59 @@ accidental changes while the workflow is still under active development."""
 from __future__ import annotations
 
 import argparse
+import contextlib
 import dataclasses
 import datetime as _dt
+import errno
+import functools
+import inspect
 import getpass
-import json
+import mmap
 import os
 import pathlib
 import platform
+import queue
 import re
 import shlex
-import shutil
 import subprocess
 import sys
-import urllib.error
-import urllib.request
-from typing import Iterable, List, Optional, Sequence
+import threading
+import time
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# Networking and JSON are imported where they are used so --help and
+# --dry-run runs do not pay for http.client/ssl/email at startup.
+if TYPE_CHECKING:
+	import urllib.request
 
 
 # -- simple-term-menu bootstrap -------------------------------------------------
 
-def _ensure_simple_term_menu() -> None:
-	"""Make sure TerminalMenu is importable.
+_TerminalMenu: Optional[type] = None
+
+
+def _ensure_simple_term_menu() -> type:
+	"""Import and return TerminalMenu, caching it for later menus.
 
 	The bash wrapper prefers shipping a native binary; this helper verifies that
 	the Python package is available and directs the operator to install it when
-	it is not present.  The rest of the code relies on the Python API uniformly."""
+	it is not present.  The rest of the code relies on the Python API uniformly.
+	It is only called from the menu helpers, so --no-menu runs never import
+	simple_term_menu (and the curses/termios machinery behind it)."""
 
-	try:  # Fast path when the package is already there.
-		import simple_term_menu  # type: ignore  # noqa: F401
-		return
+	global _TerminalMenu
+	if _TerminalMenu is not None:
+		return _TerminalMenu
+	try:
+		from simple_term_menu import TerminalMenu  # type: ignore
 	except ModuleNotFoundError:
 		message = (
 			"simple-term-menu is not installed. Install it with:\n"
 			"  pip install simple-term-menu"
 		)
 		raise SystemExit(message)
-
-
-_ensure_simple_term_menu()
-from simple_term_menu import TerminalMenu  # type: ignore  # noqa: E402
+	_TerminalMenu = TerminalMenu
+	return TerminalMenu
 
 
 # -- data definitions -----------------------------------------------------------
@@ -94,10 +108,16 @@ TASKS: Sequence[TaskDefinition] = (
 TASK_INDEX_BY_KEY = {task.key: idx for idx, task in enumerate(TASKS)}
 
 
-DEFAULTS_BY_CONTEXT = {
-	Context.ROOT: [TASK_INDEX_BY_KEY["os"], TASK_INDEX_BY_KEY["ssh"], TASK_INDEX_BY_KEY["zsh"], TASK_INDEX_BY_KEY["conda"]],
-	Context.EXISTING_USER: [TASK_INDEX_BY_KEY["ssh"], TASK_INDEX_BY_KEY["zsh"], TASK_INDEX_BY_KEY["conda"]],
-	Context.LOCAL: [TASK_INDEX_BY_KEY["zsh"], TASK_INDEX_BY_KEY["conda"]],
+def _tasks_for(*keys: str) -> tuple[TaskDefinition, ...]:
+	selected = set(keys)
+	return tuple(task for task in TASKS if task.key in selected)
+
+
+# Values are already in canonical TASKS order, so they can be run as-is.
+DEFAULTS_BY_CONTEXT: dict[str, tuple[TaskDefinition, ...]] = {
+	Context.ROOT: _tasks_for("os", "ssh", "zsh", "conda"),
+	Context.EXISTING_USER: _tasks_for("ssh", "zsh", "conda"),
+	Context.LOCAL: _tasks_for("zsh", "conda"),
 }
 
 
@@ -114,6 +134,17 @@ class PathsConfig:
 	zshrc: pathlib.Path
 	p10k: pathlib.Path
 	data_dirs: Sequence[pathlib.Path]
+	# String forms handed to subprocess arguments, rendered once per config.
+	home_dir_str: str = dataclasses.field(init=False)
+	ssh_dir_str: str = dataclasses.field(init=False)
+	ssh_keys_str: str = dataclasses.field(init=False)
+	marker_dir_str: str = dataclasses.field(init=False)
+
+	def __post_init__(self) -> None:
+		self.home_dir_str = os.fspath(self.home_dir)
+		self.ssh_dir_str = os.fspath(self.ssh_authorized_keys.parent)
+		self.ssh_keys_str = os.fspath(self.ssh_authorized_keys)
+		self.marker_dir_str = os.path.join(self.home_dir_str, MARKER_DIR_NAME)
 
 
 @dataclasses.dataclass(slots=True)
@@ -127,12 +158,43 @@ class ExecutionOptions:
 MARKER_DIR_NAME = ".server_init_markers"
 
 
-def task_marker(paths: PathsConfig, key: str) -> pathlib.Path:
-	return paths.home_dir / MARKER_DIR_NAME / f"{key}.done"
+# Matches the OS icon colour setting in ~/.p10k.zsh; [ \t] keeps matches on one line.
+_P10K_FG_RE = re.compile(
+	rb"^[ \t]*typeset[ \t]+-g[ \t]+POWERLEVEL9K_OS_ICON_FOREGROUND[ \t]*=[ \t]*\d+[ \t]*$",
+	re.MULTILINE,
+)
+
+
+# Host facts do not change while the workflow runs; look them up once.
+_SYSTEM = platform.system()
+_MACHINE = platform.machine()
+_NODE = platform.node()
+_USER = getpass.getuser()
+
+
+@functools.lru_cache(maxsize=None)
+def _which(name: str) -> Optional[str]:
+	import shutil
 
+	return shutil.which(name)
 
-def is_task_marked_complete(paths: PathsConfig, key: str) -> bool:
-	return task_marker(paths, key).exists()
+
+def task_marker(paths: PathsConfig, key: str) -> str:
+	return paths.marker_dir_str + "/" + key + ".done"
+
+
+def completed_task_markers(paths: PathsConfig) -> dict[str, bool]:
+	"""Read every completion marker with a single directory scan."""
+
+	try:
+		with os.scandir(paths.marker_dir_str) as entries:
+			return {
+				entry.name.removesuffix(".done"): True
+				for entry in entries
+				if entry.name.endswith(".done")
+			}
+	except FileNotFoundError:
+		return {}
 
 
 def mark_task_complete(paths: PathsConfig, key: str, options: ExecutionOptions) -> None:
@@ -140,8 +202,9 @@ def mark_task_complete(paths: PathsConfig, key: str, options: ExecutionOptions)
 	if options.dry_run:
 		print(f"(dry-run) Would record completion marker at {marker}.")
 		return
-	marker.parent.mkdir(parents=True, exist_ok=True)
-	marker.write_text(_dt.datetime.now().isoformat(), encoding="utf-8")
+	os.makedirs(paths.marker_dir_str, exist_ok=True)
+	with open(marker, "w", encoding="utf-8") as fh:
+		fh.write(_dt.datetime.now().isoformat())
 	print(f"Recorded completion marker at {marker}.")
 
 
@@ -149,13 +212,13 @@ def mark_task_complete(paths: PathsConfig, key: str, options: ExecutionOptions)
 
 
 def detect_os() -> OSInfo:
-	name = platform.system()
+	name = _SYSTEM
 	version = platform.version()
 	return OSInfo(name=name, version=version)
 
 
 def detect_arch() -> str:
-	return platform.machine()
+	return _MACHINE
 
 
 def prompt_yes_no(message: str, *, default: bool = False, auto_confirm: bool = False) -> bool:
@@ -181,14 +244,13 @@ def prompt_yes_no(message: str, *, default: bool = False, auto_confirm: bool = F
 		print("Please answer yes or no.")
 
 
-def defaults_for_context(context: str) -> List[int]:
-	return list(DEFAULTS_BY_CONTEXT.get(context, []))
+def defaults_for_context(context: str) -> tuple[TaskDefinition, ...]:
+	return DEFAULTS_BY_CONTEXT.get(context, ())
 
 
 def order_tasks_from_indices(indices: Iterable[int]) -> List[TaskDefinition]:
-	ordered_keys = [task.key for task in TASKS]
-	selected_keys = {TASKS[i].key for i in indices}
-	return [TASKS[ordered_keys.index(key)] for key in ordered_keys if key in selected_keys]
+	selected = set(indices)
+	return [task for idx, task in enumerate(TASKS) if idx in selected]
 
 
 def should_skip(task_key: str, context: str) -> bool:
@@ -203,7 +265,7 @@ def detect_default_paths(context: str, target_user: Optional[str] = None) -> Pat
 	if context == Context.ROOT:
 		home = pathlib.Path("/root")
 	else:
-		home = pathlib.Path(pathlib.Path.home())
+		home = pathlib.Path.home()
 	if target_user and context == Context.ROOT and target_user != "root":
 		# Allow pointing to a fresh user created during the OS task; fall back to /home/<user>.
 		home = pathlib.Path("/home") / target_user
@@ -240,31 +302,203 @@ def confirm_paths(defaults: PathsConfig, auto_confirm: bool) -> PathsConfig:
 	return PathsConfig(home, ssh_keys, zshrc, p10k, tuple(data_dirs))
 
 
+def copy_file(src: pathlib.Path, dst: pathlib.Path) -> None:
+	"""Copy file contents in-kernel and preserve metadata like shutil.copy2.
+
+	Uses os.copy_file_range where available so the bytes never bounce through
+	userspace; falls back to shutil.copyfile when the syscall is missing or the
+	filesystems do not support it."""
+
+	import shutil
+
+	copy_range = getattr(os, "copy_file_range", None)
+	if copy_range is not None:
+		try:
+			with src.open("rb") as fin, dst.open("wb") as fout:
+				fd_in, fd_out = fin.fileno(), fout.fileno()
+				size = max(os.fstat(fd_in).st_size, 1 << 20)
+				while copy_range(fd_in, fd_out, size):
+					pass
+		except OSError as exc:
+			if exc.errno not in {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP}:
+				raise
+			shutil.copyfile(src, dst)
+	else:
+		shutil.copyfile(src, dst)
+	shutil.copystat(src, dst)
+
+
+@contextlib.contextmanager
+def _map_file(path: pathlib.Path) -> Iterator[bytes | mmap.mmap]:
+	"""Map *path* read-only so it can be searched without loading it.
+
+	mmap rejects empty files, so those yield an empty bytes object instead.
+	Use .find() rather than ``in`` on the result: mmap's ``in`` only tests
+	single bytes."""
+
+	with path.open("rb") as fh:
+		if os.fstat(fh.fileno()).st_size == 0:
+			yield b""
+			return
+		with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+			yield mapped
+
+
+# Same safe-character set shlex.quote uses, so _log_join matches shlex.join.
+_SAFE_ARG = re.compile(r"[\w@%+=:,./-]+", re.ASCII).fullmatch
+
+
+def _log_join(cmd_list: Sequence[str]) -> str:
+	"""shlex.join for log lines, skipping per-argument quoting when none is needed."""
+
+	if all(map(_SAFE_ARG, cmd_list)):
+		return " ".join(cmd_list)
+	return shlex.join(cmd_list)
+
+
+def _spawn_args(cmd_list: List[str]) -> List[str]:
+	"""Resolve the executable to an absolute path when possible.
+
+	CPython only launches children via os.posix_spawn (vfork semantics, no page
+	table copy) when the executable carries a directory component, no cwd is
+	set, and close_fds is disabled.  Bare names are looked up on PATH here so
+	the common case qualifies; unresolvable names are passed through untouched
+	and fail the same way they did before."""
+
+	program = cmd_list[0]
+	if os.sep in program:
+		return cmd_list
+	resolved = _which(program)
+	if not resolved:
+		return cmd_list
+	return [resolved, *cmd_list[1:]]
+
+
+_LOG_BATCH_MAX = 64
+_LOG_BATCH_WINDOW = 0.05  # seconds
+_LOG_SENTINEL = object()
+
+
 class CommandRunner:
-	"""Wrapper that logs and optionally executes shell commands."""
+	"""Wrapper that logs and optionally executes shell commands.
+
+	Log writes are handed to a single background writer thread so callers (the
+	main loop and the concurrent commands in task_custom_zsh) never block on
+	file I/O; the writer batches whatever is pending into a single write.
+	run() lets children write straight to the log file descriptor, which suits
+	commands run one at a time.  run_async() is meant for concurrent commands,
+	so it collects each child's output and logs it with the command's header
+	and exit code as one block.  Either way capture=True hands the output back
+	on the returned CompletedProcess (it is still logged)."""
 
 	def __init__(self, *, log_file: pathlib.Path, dry_run: bool, sudo_allowed: bool) -> None:
 		self.log_file = log_file
 		self.dry_run = dry_run
 		self.sudo_allowed = sudo_allowed
-		self._log_file_handle = log_file.open("a", encoding="utf-8")
+		# Line-buffered: every logged chunk ends in a newline, so each batch is
+		# flushed by the write itself (which _sync relies on) without flush().
+		self._log_file_handle = log_file.open("a", encoding="utf-8", buffering=1)
+		self._log_queue: queue.SimpleQueue[object] = queue.SimpleQueue()
+		self._writer_error: Optional[Exception] = None
+		self._writer = threading.Thread(target=self._drain, name="server-init-log", daemon=True)
+		self._writer.start()
 
 	def close(self) -> None:
+		self._log_queue.put(_LOG_SENTINEL)
+		self._writer.join()
 		self._log_file_handle.close()
+		self._raise_writer_error()
+
+	def _raise_writer_error(self) -> None:
+		# A failed log write (disk full, EIO) surfaces on the next logging call,
+		# as it did when writes happened on the caller's thread.
+		if self._writer_error is not None:
+			raise self._writer_error
 
 	def _write(self, text: str) -> None:
-		self._log_file_handle.write(text)
-		self._log_file_handle.flush()
+		self._raise_writer_error()
+		self._log_queue.put(text)
+
+	def _sync(self) -> None:
+		"""Block until everything queued so far has reached the log file."""
+
+		self._raise_writer_error()
+		written = threading.Event()
+		self._log_queue.put(written)
+		# Poll so a writer that died after we queued the event cannot hang us.
+		while not written.wait(timeout=0.5):
+			if not self._writer.is_alive():
+				break
+		self._raise_writer_error()
+
+	def _drain(self) -> None:
+		marker: object = None
+		try:
+			while True:
+				batch = [self._log_queue.get()]
+				deadline = time.monotonic() + _LOG_BATCH_WINDOW
+				while isinstance(batch[-1], str) and len(batch) < _LOG_BATCH_MAX:
+					remaining = deadline - time.monotonic()
+					if remaining <= 0:
+						break
+					try:
+						batch.append(self._log_queue.get(timeout=remaining))
+					except queue.Empty:
+						break
+				# Sync events and the close sentinel always end a batch.
+				marker = None if isinstance(batch[-1], str) else batch.pop()
+				if batch:
+					self._log_file_handle.write("".join(batch))  # type: ignore[arg-type]
+				if isinstance(marker, threading.Event):
+					marker.set()
+				elif marker is _LOG_SENTINEL:
+					return
+		except Exception as exc:
+			self._writer_error = exc
+			if isinstance(marker, threading.Event):
+				marker.set()
+
+	def download(self, url: str, dest: pathlib.Path) -> None:
+		"""Fetch *url* into *dest* through the shared urllib opener."""
 
-	def run(
+		timestamp = _dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+		self._write(f"\n[{timestamp}] GET: {url}\ndest={dest}\n")
+		if self.dry_run:
+			self._write("(dry-run) Download not executed.\n")
+			return
+
+		import shutil
+		import urllib.error
+
+		try:
+			with _http_opener().open(url, timeout=30) as response, dest.open("wb") as fh:
+				status = response.status
+				shutil.copyfileobj(response, fh, 1 << 20)
+		except urllib.error.HTTPError as exc:
+			self._write(f"[GET {url}] status={exc.code}\n")
+			raise RuntimeError(f"Download failed with HTTP {exc.code}: {url}") from exc
+		except OSError as exc:  # URLError, timeouts, resets
+			self._write(f"[GET {url}] error={exc}\n")
+			raise RuntimeError(f"Download failed: {url}: {exc}") from exc
+		self._write(f"[GET {url}] status={status} bytes={dest.stat().st_size}\n")
+
+	def _prepare(
 		self,
 		command: Sequence[str],
 		*,
-		sudo: bool = False,
-		cwd: Optional[pathlib.Path] = None,
-		env: Optional[dict[str, str]] = None,
-		check: bool = True,
-	) -> subprocess.CompletedProcess[str] | None:
+		sudo: bool,
+		cwd: Optional[pathlib.Path],
+		env: Optional[dict[str, str]],
+		capture: bool,
+		stream: bool,
+	) -> Tuple[List[str], str, str, dict[str, object]] | None:
+		"""Build the spawn arguments shared by run/run_async.
+
+		With stream=True the header is logged now and the child writes to the
+		log directly; otherwise the header is returned so _finish can log it
+		together with the output.  Returns None in dry-run mode, after logging
+		that nothing was executed."""
+
 		timestamp = _dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 		cmd_list = list(command)
 		if sudo:
@@ -272,52 +506,162 @@ class CommandRunner:
 				raise RuntimeError("Attempted to use sudo without permission")
 			cmd_list = ["sudo", "--"] + cmd_list
 
-		joined = shlex.join(cmd_list)
-		cwd_str = str(cwd) if cwd else os.getcwd()
+		joined = _log_join(cmd_list)
+		cwd_arg = os.fspath(cwd) if cwd is not None else None
+		cwd_str = cwd_arg or os.getcwd()
 		env_keys = sorted((env or {}).keys())
-		self._write(f"\n[{timestamp}] CMD: {joined}\n")
-		self._write(f"cwd={cwd_str} sudo={sudo} env_overrides={env_keys}\n")
+		header = (
+			f"\n[{timestamp}] CMD: {joined}\n"
+			f"cwd={cwd_str} sudo={sudo} env_overrides={env_keys}\n"
+		)
 
 		if self.dry_run:
-			self._write("(dry-run) Command not executed.\n")
+			self._write(header + "(dry-run) Command not executed.\n")
 			return None
 
-		proc = subprocess.run(
-			cmd_list,
-			cwd=str(cwd) if cwd else None,
-			env={**os.environ, **(env or {})},
-			capture_output=True,
-			text=True,
-			check=False,
-		)
+		spawn_kwargs: dict[str, object] = {
+			"cwd": cwd_arg,
+			"env": {**os.environ, **env} if env else None,
+			# Python opens its own files non-inheritable (PEP 446), so keeping
+			# close_fds off is safe and lets CPython take the posix_spawn path.
+			"close_fds": cwd_arg is not None,
+		}
+		if capture:
+			spawn_kwargs.update(stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+		elif stream:
+			# The child appends to the log itself, so make sure our queued
+			# header lands first.
+			self._write(header + "--- stdout+stderr ---\n")
+			self._sync()
+			header = ""
+			spawn_kwargs.update(stdout=self._log_file_handle, stderr=self._log_file_handle)
+		else:
+			spawn_kwargs.update(stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+		return _spawn_args(cmd_list), joined, header, spawn_kwargs
 
-		self._write(f"exit_code={proc.returncode}\n")
+	def _finish(
+		self,
+		proc: subprocess.CompletedProcess[str],
+		joined: str,
+		*,
+		check: bool,
+		header: str = "",
+		output: Optional[str] = None,
+	) -> subprocess.CompletedProcess[str]:
+		result = header
+		if output:
+			result += "--- stdout+stderr ---\n" + output
+		result += f"[{joined}] exit_code={proc.returncode}\n"
 		if proc.stdout:
-			self._write("--- stdout ---\n" + proc.stdout)
+			result += "--- stdout ---\n" + proc.stdout
 		if proc.stderr:
-			self._write("--- stderr ---\n" + proc.stderr)
+			result += "--- stderr ---\n" + proc.stderr
+		self._write(result)
 
 		if check and proc.returncode != 0:
 			raise RuntimeError(f"Command failed with exit code {proc.returncode}: {joined}")
 		return proc
 
+	def run(
+		self,
+		command: Sequence[str],
+		*,
+		sudo: bool = False,
+		cwd: Optional[pathlib.Path] = None,
+		env: Optional[dict[str, str]] = None,
+		check: bool = True,
+		capture: bool = False,
+	) -> subprocess.CompletedProcess[str] | None:
+		"""Log and run *command*.
+
+		Output goes straight to the log file; pass capture=True to get it back
+		on the returned CompletedProcess instead (it is still logged)."""
+
+		prepared = self._prepare(command, sudo=sudo, cwd=cwd, env=env, capture=capture, stream=True)
+		if prepared is None:
+			return None
+		cmd_list, joined, header, spawn_kwargs = prepared
+		proc = subprocess.run(cmd_list, text=capture, check=False, **spawn_kwargs)  # type: ignore[call-overload]
+		return self._finish(proc, joined, check=check, header=header)
+
+	async def run_async(
+		self,
+		command: Sequence[str],
+		*,
+		sudo: bool = False,
+		cwd: Optional[pathlib.Path] = None,
+		env: Optional[dict[str, str]] = None,
+		check: bool = True,
+		capture: bool = False,
+	) -> subprocess.CompletedProcess[str] | None:
+		"""Coroutine counterpart of run() for use with asyncio.gather.
+
+		Output is collected per command and logged as one block with its
+		header and exit code, so concurrent commands never interleave."""
+
+		import asyncio
+
+		prepared = self._prepare(command, sudo=sudo, cwd=cwd, env=env, capture=capture, stream=False)
+		if prepared is None:
+			return None
+		cmd_list, joined, header, spawn_kwargs = prepared
+		child = await asyncio.create_subprocess_exec(*cmd_list, **spawn_kwargs)  # type: ignore[arg-type]
+		stdout, stderr = await child.communicate()
+		returncode = child.returncode or 0
+		if capture:
+			proc = subprocess.CompletedProcess(
+				cmd_list,
+				returncode,
+				stdout.decode("utf-8", errors="replace"),
+				stderr.decode("utf-8", errors="replace"),
+			)
+			return self._finish(proc, joined, check=check, header=header)
+		proc = subprocess.CompletedProcess(cmd_list, returncode)
+		output = stdout.decode("utf-8", errors="replace")
+		return self._finish(proc, joined, check=check, header=header, output=output)
+
+
+@functools.lru_cache(maxsize=None)
+def _http_opener() -> urllib.request.OpenerDirector:
+	"""Shared urllib opener for the key fetch and the Miniconda download.
+
+	Built once so both requests use the same handler chain, which honours
+	http_proxy/https_proxy/no_proxy and follows redirects."""
+
+	import urllib.request
+
+	opener = urllib.request.build_opener()
+	opener.addheaders = [("User-Agent", "server-init/1.0")]
+	return opener
+
+
+def _download_github_keys(username: str) -> Tuple[List[str], Optional[str]]:
+	"""Fetch keys without printing; returns the keys and any problem to report.
+
+	Kept silent so it can run in the background (see task_ssh_setup) without
+	writing over an interactive prompt."""
+
+	import http.client
 
-def fetch_github_keys(username: str) -> List[str]:
 	url = f"https://github.com/{username}.keys"
-	request = urllib.request.Request(url, headers={"User-Agent": "server-init/1.0"})
 	try:
-		with urllib.request.urlopen(request, timeout=10) as response:
-			status = getattr(response, "status", response.getcode())
+		with _http_opener().open(url, timeout=10) as response:
+			status = response.status
 			if status != 200:
-				print(f"Failed to fetch keys for GitHub user '{username}' (HTTP {status}).")
-				return []
+				return [], f"Failed to fetch keys for GitHub user '{username}' (HTTP {status})."
 			data = response.read().decode("utf-8", errors="ignore")
-	except urllib.error.URLError as exc:
-		print(f"Failed to fetch keys for GitHub user '{username}': {exc}")
-		return []
+	except (OSError, http.client.HTTPException) as exc:  # URLError is an OSError.
+		return [], f"Failed to fetch keys for GitHub user '{username}': {exc}"
 	keys = [line.strip() for line in data.splitlines() if line.strip()]
 	if not keys:
-		print(f"No public keys found for GitHub user '{username}'.")
+		return keys, f"No public keys found for GitHub user '{username}'."
+	return keys, None
+
+
+def fetch_github_keys(username: str) -> List[str]:
+	keys, problem = _download_github_keys(username)
+	if problem:
+		print(problem)
 	return keys
 
 
@@ -325,6 +669,7 @@ def fetch_github_keys(username: str) -> List[str]:
 
 
 def _run_menu(options: Sequence[str], *, title: str, cursor_index: int = 0) -> int:
+	TerminalMenu = _ensure_simple_term_menu()
 	menu = TerminalMenu(options, title=title, cursor_index=cursor_index)
 	index = menu.show()
 	if index is None:
@@ -338,6 +683,7 @@ def _run_multi_menu(
 	title: str,
 	preselected: Sequence[int],
 ) -> List[int]:
+	TerminalMenu = _ensure_simple_term_menu()
 	menu = TerminalMenu(
 		options,
 		title=title,
@@ -355,7 +701,7 @@ def _run_multi_menu(
 
 
 def task_os_settings(runner: CommandRunner, options: ExecutionOptions, paths: PathsConfig) -> None:
-	current_hostname = platform.node()
+	current_hostname = _NODE
 	print(f"\n[OS settings] Current hostname: {current_hostname}")
 
 	if prompt_yes_no(
@@ -370,7 +716,7 @@ def task_os_settings(runner: CommandRunner, options: ExecutionOptions, paths: Pa
 			print("Hostname unchanged (empty value).")
 
 	is_root = hasattr(os, "geteuid") and os.geteuid() == 0
-	current_user = getpass.getuser()
+	current_user = _USER
 	if is_root:
 		if prompt_yes_no(
 			"Create a new user account?",
@@ -402,18 +748,32 @@ def task_os_settings(runner: CommandRunner, options: ExecutionOptions, paths: Pa
 
 def task_ssh_setup(runner: CommandRunner, options: ExecutionOptions, paths: PathsConfig) -> None:
 	print("\n[SSH setup] Preparing ~/.ssh/authorized_keys flow.")
-	if not options.dry_run:
-		paths.ssh_authorized_keys.parent.mkdir(parents=True, exist_ok=True)
-		paths.ssh_authorized_keys.touch(exist_ok=True)
-	runner.run(["chmod", "700", str(paths.ssh_authorized_keys.parent)], sudo=False)
-	runner.run(["chmod", "600", str(paths.ssh_authorized_keys)], sudo=False)
-
 	default_username = (
 		os.environ.get("GITHUB_USERNAME")
 		or os.environ.get("GH_USERNAME")
 		or os.environ.get("GH_USER")
 		or ""
 	)
+	# Start fetching the likely keys now so the HTTP round trip overlaps with
+	# the chmods and the username prompt below.  The thread is a daemon: if
+	# the user types a different name its result is simply discarded, and a
+	# slow request can never hold up interpreter exit.
+	prefetched: List[Tuple[List[str], Optional[str]]] = []
+	prefetch: Optional[threading.Thread] = None
+	if default_username:
+		prefetch = threading.Thread(
+			target=lambda: prefetched.append(_download_github_keys(default_username)),
+			name="github-keys-prefetch",
+			daemon=True,
+		)
+		prefetch.start()
+
+	if not options.dry_run:
+		paths.ssh_authorized_keys.parent.mkdir(parents=True, exist_ok=True)
+		paths.ssh_authorized_keys.touch(exist_ok=True)
+	runner.run(["chmod", "700", paths.ssh_dir_str], sudo=False)
+	runner.run(["chmod", "600", paths.ssh_keys_str], sudo=False)
+
 	github_username = default_username
 	if not options.auto_confirm:
 		prompt = "GitHub username for SSH keys"
@@ -427,16 +787,23 @@ def task_ssh_setup(runner: CommandRunner, options: ExecutionOptions, paths: Path
 		print("Auto-confirm enabled but no GitHub username provided via environment; skipping key download.")
 
 	if github_username:
-		keys = fetch_github_keys(github_username)
+		if prefetch is not None and github_username == default_username:
+			prefetch.join()
+			# An empty list means the thread died before appending a result.
+			keys, problem = prefetched[0] if prefetched else ([], f"Failed to fetch keys for GitHub user '{github_username}'.")
+			if problem:
+				print(problem)
+		else:
+			keys = fetch_github_keys(github_username)
 		if keys:
-			existing_keys: set[str] = set()
+			existing_keys: frozenset[str] = frozenset()
 			if paths.ssh_authorized_keys.exists():
 				existing_content = paths.ssh_authorized_keys.read_text(encoding="utf-8", errors="ignore")
-				existing_keys = {
-					line.strip()
-					for line in existing_content.splitlines()
-					if line.strip() and not line.startswith("#")
-				}
+				existing_keys = frozenset(
+					stripped
+					for stripped in map(str.strip, existing_content.splitlines())
+					if stripped and not stripped.startswith("#")
+				)
 			new_keys = [key for key in keys if key not in existing_keys]
 			if not new_keys:
 				print(f"All keys for GitHub user '{github_username}' are already present in {paths.ssh_authorized_keys}.")
@@ -445,10 +812,10 @@ def task_ssh_setup(runner: CommandRunner, options: ExecutionOptions, paths: Path
 				if options.dry_run:
 					print(f"(dry-run) Would append {len(new_keys)} keys for '{github_username}' to {paths.ssh_authorized_keys}.")
 				else:
+					header = f"\n# GitHub keys for {github_username} added {timestamp}"
+					payload = "\n".join([header, *new_keys, ""])
 					with paths.ssh_authorized_keys.open("a", encoding="utf-8") as fh:
-						fh.write(f"\n# GitHub keys for {github_username} added {timestamp}\n")
-						for key in new_keys:
-							fh.write(f"{key}\n")
+						fh.write(payload)
 					print(f"Added {len(new_keys)} keys for GitHub user '{github_username}'.")
 	else:
 		print("No GitHub username provided; skipping public key download.")
@@ -456,66 +823,95 @@ def task_ssh_setup(runner: CommandRunner, options: ExecutionOptions, paths: Path
 	mark_task_complete(paths, "ssh", options)
 
 
-def task_custom_zsh(runner: CommandRunner, options: ExecutionOptions, paths: PathsConfig) -> None:
+async def task_custom_zsh(runner: CommandRunner, options: ExecutionOptions, paths: PathsConfig) -> None:
+	import asyncio
+
 	print("\n[Customized zsh] Installing zsh and plugins (logged only by default).")
-	commands = [
-		(["apt", "update"], True),
-		(["apt", "install", "-y", "zsh"], True),
-		([
+	# Package installation must stay ordered and runs with sudo.
+	apt_commands = [
+		["apt", "update"],
+		["apt", "install", "-y", "zsh"],
+	]
+	# Nothing else is in flight yet, so run these directly and let apt's
+	# (long) output stream into the log instead of buffering it.
+	for cmd in apt_commands:
+		runner.run(cmd, sudo=True)
+
+	# The plugin clones and installers are independent and network-bound, so fan them out.
+	zsh_dir = os.path.join(paths.home_dir_str, ".zsh")
+	fzf_dir = os.path.join(paths.home_dir_str, "toolchain", "fzf")
+	clone_commands = [
+		[
 			"git",
 			"clone",
 			"--depth=1",
 			"https://github.com/romkatv/powerlevel10k.git",
-			str(paths.home_dir / ".zsh" / "powerlevel10k"),
-		], False),
-		([
+			os.path.join(zsh_dir, "powerlevel10k"),
+		],
+		[
 			"git",
 			"clone",
 			"https://github.com/zsh-users/zsh-autosuggestions",
-			str(paths.home_dir / ".zsh" / "zsh-autosuggestions"),
-		], False),
-		([
+			os.path.join(zsh_dir, "zsh-autosuggestions"),
+		],
+		[
 			"git",
 			"clone",
 			"https://github.com/zsh-users/zsh-syntax-highlighting.git",
-			str(paths.home_dir / ".zsh" / "zsh-syntax-highlighting"),
-		], False),
-		# fzf installation (user space)
-		([
+			os.path.join(zsh_dir, "zsh-syntax-highlighting"),
+		],
+		# Atuin installation (pipe script); it edits ~/.zshrc, so it has to
+		# finish before the dotfiles are copied and the palette shell starts.
+		[
+			"bash",
+			"-lc",
+			"curl -fsSL https://raw.githubusercontent.com/atuinsh/atuin/main/install.sh | bash",
+		],
+	]
+	# fzf installation (user space); the install script needs the clone first.
+	fzf_commands = [
+		[
 			"git",
 			"clone",
 			"--depth",
 			"1",
 			"https://github.com/junegunn/fzf.git",
-			str(paths.home_dir / "toolchain" / "fzf"),
-		], False),
-		([
+			fzf_dir,
+		],
+		[
 			"bash",
-			str(paths.home_dir / "toolchain" / "fzf" / "install"),
+			os.path.join(fzf_dir, "install"),
 			"--all",
 			"--no-update-rc",
-		], False),
-		# Atuin installation (pipe script)
-		([
-			"bash",
-			"-lc",
-			"curl -fsSL https://raw.githubusercontent.com/atuinsh/atuin/main/install.sh | bash",
-		], False),
+		],
 	]
-	for cmd, sudo in commands:
-		runner.run(cmd, sudo=sudo)
+
+	async def _run_sequence(cmds: Sequence[Sequence[str]]) -> None:
+		for cmd in cmds:
+			await runner.run_async(cmd, sudo=False)
+
+	# Let every job finish before reporting a failure so no child process is
+	# left running once the runner closes.
+	results = await asyncio.gather(
+		*(runner.run_async(cmd, sudo=False) for cmd in clone_commands),
+		_run_sequence(fzf_commands),
+		return_exceptions=True,
+	)
+	for result in results:
+		if isinstance(result, BaseException):
+			raise result
 
 	current_shell = os.environ.get("SHELL", "")
-	zsh_path = shutil.which("zsh")
-	if not zsh_path:
-		zsh_path = "/usr/bin/zsh"
-	target_user = paths.home_dir.name or getpass.getuser()
-	if current_shell.endswith("zsh") and target_user == getpass.getuser():
+	# Looked up after the apt install above so a freshly installed zsh is found.
+	zsh_found = _which("zsh")
+	zsh_path = zsh_found or "/usr/bin/zsh"
+	target_user = paths.home_dir.name or _USER
+	if current_shell.endswith("zsh") and target_user == _USER:
 		print("Default shell already set to zsh; skipping chsh.")
 	else:
 		chsh_cmd: List[str] = ["chsh", "-s", zsh_path]
 		sudo_for_chsh = False
-		if target_user and target_user != getpass.getuser():
+		if target_user and target_user != _USER:
 			chsh_cmd.append(target_user)
 			sudo_for_chsh = True
 		runner.run(chsh_cmd, sudo=sudo_for_chsh)
@@ -530,19 +926,36 @@ def task_custom_zsh(runner: CommandRunner, options: ExecutionOptions, paths: Pat
 		zshrc_src = repo_root / ".zshrc"
 		p10k_src = repo_root / ".p10k_simplified_cmt.zsh"
 		if zshrc_src.exists():
-			shutil.copy2(zshrc_src, paths.zshrc)
+			copy_file(zshrc_src, paths.zshrc)
 		if p10k_src.exists():
-			shutil.copy2(p10k_src, paths.p10k)
+			copy_file(p10k_src, paths.p10k)
+
+	await _customize_p10k_theme(runner, options, paths, zsh_available=zsh_found is not None)
+
+	print(
+		"Atuin reminder: set sync_address = \"http://170.9.246.109:11040\" in "
+		f"{paths.home_dir / '.config' / 'atuin' / 'config.toml'} and run 'atuin login' to use PaperL's self-hosted server."
+	)
+
+	mark_task_complete(paths, "zsh", options)
 
+
+async def _customize_p10k_theme(
+	runner: CommandRunner,
+	options: ExecutionOptions,
+	paths: PathsConfig,
+	*,
+	zsh_available: bool,
+) -> None:
 	# Theme color customization: display palette (when possible), prompt, and update p10k
 	print("\n[Customized zsh] Theme color customization for POWERLEVEL9K_OS_ICON_FOREGROUND")
 	palette_cmd = (
 		'for i in {0..255}; do print -Pn "%K{$i}  %k%F{$i}${(l:3::0:)i}%f " ${${(M)$((i%6)):#3}:+$\'\n\'}; done'
 	)
 	showed_palette = False
-	if not options.dry_run and shutil.which("zsh"):
+	if not options.dry_run and zsh_available:
 		try:
-			proc = runner.run(["zsh", "-ic", palette_cmd], sudo=False, check=False)
+			proc = await runner.run_async(["zsh", "-ic", palette_cmd], sudo=False, check=False, capture=True)
 			if proc and proc.stdout:
 				# Print palette for user to see
 				print(proc.stdout)
@@ -576,19 +989,22 @@ def task_custom_zsh(runner: CommandRunner, options: ExecutionOptions, paths: Pat
 			ts = _dt.datetime.now().strftime("%Y%m%d_%H%M%S")
 			backup = paths.p10k.with_suffix(paths.p10k.suffix + f".bak.{ts}")
 			try:
-				shutil.copy2(paths.p10k, backup)
+				copy_file(paths.p10k, backup)
 			except Exception as e:  # pragma: no cover
 				print(f"Warning: failed to create backup {backup}: {e}")
 
-			content = paths.p10k.read_text(encoding="utf-8")
-			pattern = re.compile(r"^\s*typeset\s+-g\s+POWERLEVEL9K_OS_ICON_FOREGROUND\s*=\s*\d+\s*$", re.MULTILINE)
-			if pattern.search(content):
-				content = pattern.sub(new_line.strip(), content)
+			content = None
+			with _map_file(paths.p10k) as mapped:
+				match = _P10K_FG_RE.search(mapped)
+				if match:
+					# Slicing the mapping copies it out, so the file is read only once.
+					content = mapped[:match.start()] + new_line.strip().encode() + mapped[match.end():]
+				needs_newline = mapped[-1:] != b"\n"
+			if content is not None:
+				paths.p10k.write_bytes(content)
 			else:
-				if not content.endswith("\n"):
-					content += "\n"
-				content += new_line
-			paths.p10k.write_text(content, encoding="utf-8")
+				with paths.p10k.open("ab") as fh:
+					fh.write((b"\n" if needs_newline else b"") + new_line.encode())
 			print(f"Updated {paths.p10k} (backup at {backup}).")
 	else:
 		# Create a minimal file with the setting
@@ -598,13 +1014,6 @@ def task_custom_zsh(runner: CommandRunner, options: ExecutionOptions, paths: Pat
 			paths.p10k.write_text(new_line, encoding="utf-8")
 			print(f"Created {paths.p10k} with OS icon color {color_id}.")
 
-	print(
-		"Atuin reminder: set sync_address = \"http://170.9.246.109:11040\" in "
-		f"{paths.home_dir / '.config' / 'atuin' / 'config.toml'} and run 'atuin login' to use PaperL's self-hosted server."
-	)
-
-	mark_task_complete(paths, "zsh", options)
-
 
 def task_miniconda(runner: CommandRunner, options: ExecutionOptions, paths: PathsConfig, arch: str) -> None:
 	print("\n[Miniconda] Checking/installing under ~/toolchain/miniconda3.")
@@ -612,13 +1021,14 @@ def task_miniconda(runner: CommandRunner, options: ExecutionOptions, paths: Path
 	# Target prefix under toolchain
 	prefix = paths.home_dir / "toolchain" / "miniconda3"
 	conda_bin = prefix / "bin" / "conda"
+	conda_cmd = os.fspath(conda_bin)
 
 	# Idempotency: if conda already exists at the target, skip the installer
 	if conda_bin.exists():
 		print(f"Miniconda already present at {prefix}. Skipping installer.")
 	else:
 		# Determine OS-specific installer URL
-		system = platform.system()
+		system = _SYSTEM
 		if system == "Darwin":
 			if arch in {"arm64", "aarch64"}:
 				url = "https://repo.anaconda.com/miniconda/Miniconda3-latest-MacOSX-arm64.sh"
@@ -637,14 +1047,14 @@ def task_miniconda(runner: CommandRunner, options: ExecutionOptions, paths: Path
 			return
 
 		installer = paths.home_dir / "miniconda-installer.sh"
-		runner.run(["wget", "-O", str(installer), url])
+		runner.download(url, installer)
 		# Ensure toolchain directory exists when not in dry-run
 		if not options.dry_run:
 			(paths.home_dir / "toolchain").mkdir(parents=True, exist_ok=True)
-		runner.run(["bash", str(installer), "-b", "-p", str(prefix)])
+		runner.run(["bash", os.fspath(installer), "-b", "-p", os.fspath(prefix)])
 
 	# Post-install configuration using the detected/target conda
-	runner.run([str(conda_bin), "config", "--set", "auto_activate_base", "false"])
+	runner.run([conda_cmd, "config", "--set", "auto_activate_base", "false"])
 
 	env_dir = prefix / "envs" / "py12"
 	if env_dir.exists():
@@ -669,7 +1079,7 @@ def task_miniconda(runner: CommandRunner, options: ExecutionOptions, paths: Path
 			else:
 				runner.run(
 					[
-						str(conda_bin),
+						conda_cmd,
 						"tos",
 						"accept",
 						"--override-channels",
@@ -679,19 +1089,21 @@ def task_miniconda(runner: CommandRunner, options: ExecutionOptions, paths: Path
 					sudo=False,
 				)
 
-		runner.run([str(conda_bin), "create", "-y", "-n", "py12", "python=3.12"])
+		runner.run([conda_cmd, "create", "-y", "-n", "py12", "python=3.12"])
 
-	runner.run([str(conda_bin), "init", "zsh"])
+	runner.run([conda_cmd, "init", "zsh"])
 
 	activation_line = "conda activate py12"
 	if paths.zshrc.exists():
-		existing = paths.zshrc.read_text(encoding="utf-8")
-		if activation_line not in existing:
+		with _map_file(paths.zshrc) as existing:
+			present = existing.find(activation_line.encode()) != -1
+			needs_newline = existing[-1:] != b"\n"
+		if not present:
 			if options.dry_run:
 				print(f"(dry-run) Would append '{activation_line}' to {paths.zshrc}.")
 			else:
 				with paths.zshrc.open("a", encoding="utf-8") as fh:
-					if not existing.endswith("\n"):
+					if needs_newline:
 						fh.write("\n")
 					fh.write(f"{activation_line}\n")
 	else:
@@ -779,12 +1191,32 @@ def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
 # -- state management ----------------------------------------------------------
 
 
+def _json_loads(data: bytes) -> object:
+	try:  # orjson is optional; it parses bytes directly in C.
+		import orjson  # type: ignore
+	except ModuleNotFoundError:
+		import json
+
+		return json.loads(data)
+	return orjson.loads(data)
+
+
+def _json_dumps(state: dict[str, bool]) -> bytes:
+	try:
+		import orjson  # type: ignore
+	except ModuleNotFoundError:
+		import json
+
+		return json.dumps(state, indent=2, sort_keys=True).encode("utf-8")
+	return orjson.dumps(state, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS)
+
+
 def load_state(path: pathlib.Path | None) -> dict[str, bool]:
 	if not path or not path.exists():
 		return {}
 	try:
-		return json.loads(path.read_text(encoding="utf-8"))
-	except json.JSONDecodeError:
+		return _json_loads(path.read_bytes())  # type: ignore[return-value]
+	except ValueError:  # json/orjson decode errors and bad UTF-8 all subclass it.
 		print(f"Failed to parse state file at {path}; starting fresh.")
 		return {}
 
@@ -792,7 +1224,7 @@ def load_state(path: pathlib.Path | None) -> dict[str, bool]:
 def save_state(path: pathlib.Path | None, state: dict[str, bool]) -> None:
 	if not path:
 		return
-	path.write_text(json.dumps(state, indent=2, sort_keys=True), encoding="utf-8")
+	path.write_bytes(_json_dumps(state))
 
 
 # -- core workflow -------------------------------------------------------------
@@ -818,25 +1250,28 @@ def resolve_tasks(
 	context: str,
 	auto_confirm: bool,
 	use_menu: bool,
-) -> List[int]:
+) -> Sequence[TaskDefinition]:
+	"""Return the selected tasks in canonical TASKS order."""
+
 	if args.tasks:
 		requested = [token.strip().lower() for token in args.tasks.split(",") if token.strip()]
 		invalid = [token for token in requested if token not in TASK_INDEX_BY_KEY]
 		if invalid:
 			raise SystemExit(f"Invalid task identifiers: {', '.join(invalid)}")
-		indices = [TASK_INDEX_BY_KEY[token] for token in requested]
+		tasks: Sequence[TaskDefinition] = order_tasks_from_indices(TASK_INDEX_BY_KEY[token] for token in requested)
 	else:
-		indices = defaults_for_context(context)
+		tasks = defaults_for_context(context)
 
 	if args.no_menu or not use_menu or (args.tasks and auto_confirm):
-		return indices
+		return tasks
 
 	options = [task.title for task in TASKS]
-	return _run_multi_menu(
+	indices = _run_multi_menu(
 		options,
 		title="Select tasks (SPACE to toggle, ENTER to confirm)",
-		preselected=indices,
+		preselected=[TASK_INDEX_BY_KEY[task.key] for task in tasks],
 	)
+	return order_tasks_from_indices(indices)
 
 
 def ensure_command_execution_safety(args: argparse.Namespace) -> ExecutionOptions:
@@ -875,6 +1310,12 @@ def prepare_logger(log_file: pathlib.Path | None) -> pathlib.Path:
 
 def main(argv: Optional[Sequence[str]] = None) -> int:
 	args = parse_args(argv)
+	import asyncio
+
+	return asyncio.run(main_async(args))
+
+
+async def main_async(args: argparse.Namespace) -> int:
 	state_path = args.resume_state or pathlib.Path(".server_init_state.json")
 	state = load_state(state_path)
 
@@ -885,11 +1326,11 @@ def main(argv: Optional[Sequence[str]] = None) -> int:
 
 	use_menu = not args.no_menu
 	context = resolve_context(args, auto_confirm=args.yes, use_menu=use_menu)
-	selected_indices = resolve_tasks(args, context=context, auto_confirm=args.yes, use_menu=use_menu)
+	ordered_tasks = resolve_tasks(args, context=context, auto_confirm=args.yes, use_menu=use_menu)
 
 	options = ensure_command_execution_safety(args)
 
-	current_user = getpass.getuser()
+	current_user = _USER
 	target_for_paths = None if context == Context.ROOT else current_user
 	paths = detect_default_paths(context, target_for_paths)
 	paths = confirm_paths(paths, options.auto_confirm)
@@ -899,20 +1340,17 @@ def main(argv: Optional[Sequence[str]] = None) -> int:
 
 	runner = CommandRunner(log_file=log_path, dry_run=options.dry_run, sudo_allowed=options.sudo_allowed)
 
-	ordered_tasks = order_tasks_from_indices(selected_indices)
 	completed: dict[str, bool] = {}
 	completed.update(state)
+	# Markers and the state file are both sources of truth; merge them once so
+	# the loop below only does dictionary lookups.
+	completed.update(completed_task_markers(paths))
 
 	try:
 		for task in ordered_tasks:
 			if should_skip(task.key, context):
 				print(f"Skipping {task.title} due to context rules.")
 				continue
-			if not args.force and is_task_marked_complete(paths, task.key):
-				marker = task_marker(paths, task.key)
-				print(f"Skipping {task.title} (already completed at {marker}).")
-				completed[task.key] = True
-				continue
 			if completed.get(task.key) and not args.force:
 				print(f"Skipping {task.title} (already completed; use --force to rerun).")
 				continue
@@ -923,9 +1361,11 @@ def main(argv: Optional[Sequence[str]] = None) -> int:
 				continue
 
 			if task.key == "conda":
-				impl(runner, options, paths, arch)  # type: ignore[arg-type]
+				outcome = impl(runner, options, paths, arch)  # type: ignore[arg-type]
 			else:
-				impl(runner, options, paths)  # type: ignore[misc]
+				outcome = impl(runner, options, paths)  # type: ignore[misc]
+			if inspect.isawaitable(outcome):
+				await outcome
 
 			completed[task.key] = True
 	finally:
@@ -936,7 +1376,7 @@ def main(argv: Optional[Sequence[str]] = None) -> int:
 	summary_lines = [
 		"\nRun summary:",
 		f"  Context: {context}",
-		f"  Tasks requested: {[TASKS[i].key for i in selected_indices]}",
+		f"  Tasks requested: {[task.key for task in ordered_tasks]}",
 		f"  Tasks completed: {[key for key, done in completed.items() if done]}",
 		f"  Log file: {log_path}",
 	]